@@ -0,0 +1,81 @@
+"""
+Per-row vCard formatting helpers used by vcf_maker.
+
+This module is plain, fully annotated Python so it can optionally be compiled
+with mypyc (`mypyc _vcf_fast.py` inside scripts/). When a compiled extension is
+present next to this file, `import _vcf_fast` picks it up automatically;
+otherwise this source is imported as-is.
+"""
+import re
+from typing import List, Optional, Tuple
+
+
+PHONE_STRIP_PATTERN = r"[^0-9+]+"
+
+_VCARD_ESCAPE = str.maketrans({'\r': ' ', '\n': ' ', ',': r'\,', ';': r'\;'})
+_VCARD_SPECIALS = ('\\', '\r', '\n', ',', ';')
+
+# bytes dropped by sanitize_phone: everything except ASCII digits and '+'
+_PHONE_DELETE = bytes(b for b in range(256) if not (0x30 <= b <= 0x39 or b == 0x2B))
+_PHONE_RE = re.compile(PHONE_STRIP_PATTERN)
+
+
+def escape_vcard_value(value: Optional[str]) -> str:
+    if not value:
+        return ""
+    # most values contain nothing to escape
+    for ch in _VCARD_SPECIALS:
+        if ch in value:
+            break
+    else:
+        return value.strip()
+    # backslashes are doubled first so the escapes added below stay intact
+    return value.replace('\\', '\\\\').translate(_VCARD_ESCAPE).strip()
+
+
+def sanitize_phone(phone: Optional[str]) -> str:
+    if phone is None:
+        return ""
+    # keep digits and leading + only
+    if phone.isascii():
+        if phone.isdigit():
+            return phone
+        return phone.encode("ascii").translate(None, _PHONE_DELETE).decode("ascii")
+    return _PHONE_RE.sub("", phone)
+
+
+def format_n_field(full_name: str) -> str:
+    # Try to split into family;given;additional;prefix;suffix
+    if not full_name:
+        return ";;;;;"
+    parts = full_name.split()
+    n = len(parts)
+    # most names have one or two words; only longer ones need the middle re-joined
+    if n == 2:
+        given, family = parts
+        return f"{family};{given};;;"
+    if n == 1:
+        return f";{parts[0]};;;"
+    if not n:
+        return ";;;;;"
+    return f"{parts[-1]};{parts[0]};{' '.join(parts[1:-1])};;"
+
+
+def format_vcard_tels(fn: str, tels: List[Tuple[Optional[str], str]]) -> str:
+    # tels: (number, label) pairs with labels already upper-cased
+    tel_block = ""
+    for number, label in tels:
+        num = sanitize_phone(number)
+        if num:
+            # allow comma-separated types
+            tel_block += "TEL;TYPE=" + label + ":" + num + "\n"
+    return ("BEGIN:VCARD\nVERSION:3.0\nFN:" + escape_vcard_value(fn)
+            + "\nN:" + escape_vcard_value(format_n_field(fn)) + "\n"
+            + tel_block + "END:VCARD\n")
+
+
+def format_row(name: str, tels: List[Tuple[Optional[str], str]], prefix: str, postfix: str) -> str:
+    # prefix/postfix must already be stripped; empty parts are left out of the display name
+    name = name.strip()
+    full_name = " ".join([p for p in (prefix, name, postfix) if p])
+    return format_vcard_tels(full_name, tels)
@@ -1,23 +1,36 @@
 # build_exe.ps1
 # Usage: Open PowerShell in project root and run:
 #   .\scripts\build_exe.ps1
+# Add -Compile to build scripts\_vcf_fast.py with mypyc first (needs a C compiler).
 
 param(
     [string]$Entry = "scripts\vcf_maker_gui.py",
-    [string]$Name = "vcf_maker_gui"
+    [string]$Name = "vcf_maker_gui",
+    [switch]$Compile
 )
 
 Write-Host "Ensuring PyInstaller is installed..."
 python -m pip install --upgrade pip setuptools wheel | Write-Host
 python -m pip install pyinstaller | Write-Host
 
+if ($Compile) {
+    Write-Host "Compiling scripts\_vcf_fast.py with mypyc..."
+    python -m pip install mypy | Write-Host
+    # the extension is written next to _vcf_fast.py and preferred over it on import
+    Push-Location scripts
+    python -m mypyc _vcf_fast.py
+    Pop-Location
+}
+
 # Build single-file windowed executable.
-# --add-data: include vcf_maker.py next to the exe in the bundle (Windows uses ';' separator)
+# --add-data: include vcf_maker.py and _vcf_fast.py next to the exe in the bundle (Windows uses ';' separator)
 $addData = "scripts\vcf_maker.py;."
+$addFast = "scripts\_vcf_fast.py;."
 
 Write-Host "Running PyInstaller via python -m PyInstaller..."
 # Use python -m PyInstaller so we don't depend on Scripts being on PATH
-python -m PyInstaller --noconfirm --onefile --windowed --name $Name --add-data "$addData" $Entry
+# --exclude-module pyarrow: only the CLI's optional fast path uses it, and it would add ~170 MB to the exe
+python -m PyInstaller --noconfirm --onefile --windowed --name $Name --add-data "$addData" --add-data "$addFast" --exclude-module pyarrow $Entry
 
 if ($LASTEXITCODE -eq 0) {
     Write-Host "Build succeeded. Output in dist\$Name.exe"
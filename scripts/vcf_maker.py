@@ -1,76 +1,54 @@
 import argparse
 import csv
 import os
-import re
 import sys
-from typing import Iterable, Dict, List, Optional, Callable
-import threading
-
-
-def escape_vcard_value(value: str) -> str:
-    if value is None:
-        return ""
-    v = value.replace('\\', '\\\\')
-    v = v.replace('\r', ' ').replace('\n', ' ')
-    v = v.replace(',', r'\,').replace(';', r'\;')
-    return v.strip()
-
-
-def sanitize_phone(phone: str) -> str:
-    if phone is None:
-        return ""
-    # keep digits and leading + only
-    phone = phone.strip()
-    sanitized = re.sub(r"[^0-9+]+", "", phone)
-    return sanitized
-
-
-def format_n_field(full_name: str) -> str:
-    # Try to split into family;given;additional;prefix;suffix
-    if not full_name:
-        return ";;;;;"
-    parts = full_name.split()
-    if len(parts) == 1:
-        given = parts[0]
-        family = ""
-        additional = ""
-    else:
-        given = parts[0]
-        family = parts[-1]
-        additional = " ".join(parts[1:-1]) if len(parts) > 2 else ""
-    return f"{family};{given};{additional};;"
+import time
+from itertools import islice
+from operator import itemgetter
+from typing import TYPE_CHECKING, Dict, List, Optional, Callable, Tuple
+
+if TYPE_CHECKING:
+    # only needed for the stop_event annotations
+    import threading
+
+# optional: pyarrow parses CSV into columnar batches much faster than the csv module.
+# It is slow to import, so it is loaded on first use by write_vcards_vectorized only
+# (the GUI imports this module at startup but never needs pyarrow).
+pa = pc = pacsv = None
+PYARROW_AVAILABLE: Optional[bool] = None  # None until the import has been tried
+
+
+def _load_pyarrow() -> bool:
+    global pa, pc, pacsv, PYARROW_AVAILABLE
+    if PYARROW_AVAILABLE is None:
+        try:
+            import pyarrow
+            import pyarrow.compute
+            import pyarrow.csv
+            pa, pc, pacsv = pyarrow, pyarrow.compute, pyarrow.csv
+            PYARROW_AVAILABLE = True
+        except Exception:
+            PYARROW_AVAILABLE = False
+    return PYARROW_AVAILABLE
+
+# per-row helpers live in _vcf_fast so they can be compiled with mypyc
+from _vcf_fast import PHONE_STRIP_PATTERN, escape_vcard_value, format_n_field, format_row, format_vcard_tels, sanitize_phone
 
 
 def format_vcard(fn: str, phones: List[Dict[str, str]]) -> str:
     # phones: list of dicts with keys 'number' and 'label'
-    fn_escaped = escape_vcard_value(fn)
-    n_field = escape_vcard_value(format_n_field(fn))
-    lines = ["BEGIN:VCARD", "VERSION:3.0", f"FN:{fn_escaped}", f"N:{n_field}"]
-    for p in phones:
-        num = sanitize_phone(p.get("number", ""))
-        if not num:
-            continue
-        label = (p.get("label") or "CELL").upper()
-        # allow comma-separated types
-        lines.append(f"TEL;TYPE={label}:{num}")
-    lines.append("END:VCARD\n")
-    return "\n".join(lines)
-
-
-def read_contacts(path: str, fields: List[str]) -> Iterable[Dict[str, str]]:
-    try:
-        with open(path, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                yield row
-    except FileNotFoundError:
-        print(f"Input file not found: {path}", file=sys.stderr)
-        sys.exit(2)
+    return format_vcard_tels(fn, [(p.get("number", ""), (p.get("label") or "CELL").upper()) for p in phones])
+
+
+def _phone_label(phone_labels: List[str], idx: int) -> str:
+    # label for the idx-th phone field, normalized the way format_vcard does it
+    label = phone_labels[idx] if idx < len(phone_labels) else ""
+    return (label or "CELL").upper()
 
 
 def get_csv_fieldnames(path: str) -> Optional[List[str]]:
     try:
-        with open(path, newline="", encoding="utf-8") as f:
+        with open(path, newline="", encoding="utf-8-sig") as f:
             reader = csv.DictReader(f)
             return reader.fieldnames or []
     except FileNotFoundError:
@@ -115,77 +93,174 @@ def choose_field(headers: List[str], desired: Optional[str], field_type: str) ->
     return headers[0]
 
 
-def write_vcards(contacts: Iterable[Dict[str, str]], out_path: str, name_field: str, phone_field: str, postfix: str) -> None:
-    try:
-        with open(out_path, "w", encoding="utf-8", newline="") as vcf:
-            for c in contacts:
-                name = (c.get(name_field) or "").strip()
-                phone = (c.get(phone_field) or "").strip()
-                if not phone:
-                    continue
-                full_name = (name + postfix).strip() if postfix else name
-                vcf.write(format_vcard(full_name, phone))
-    except OSError as e:
-        print(f"Failed to write output file: {e}", file=sys.stderr)
-        sys.exit(3)
-    except OSError as e:
-        print(f"Failed to write output file: {e}", file=sys.stderr)
-        sys.exit(3)
-
-
-def count_csv_rows(path: str) -> int:
-    # count non-header rows
-    with open(path, newline="", encoding="utf-8") as f:
-        reader = csv.reader(f)
-        # consume header
-        try:
-            next(reader)
-        except StopIteration:
-            return 0
-        return sum(1 for _ in reader)
+# output is opened in binary mode with a large buffer and fed UTF-8 encoded chunks
+# instead of one text-mode write (and encode) per vCard
+_WRITE_BUFFER_SIZE = 1 << 20
+_FLUSH_THRESHOLD = 1 << 16
+# rows are parsed in batches; cancel and progress are checked between batches
+_ROW_BATCH_SIZE = 4096
+# minimum seconds between progress callbacks
+_PROGRESS_INTERVAL = 0.05
+
+
+def _resolve_columns(headers: List[str], name_field: str, phone_fields: List[str], phone_labels: Optional[List[str]]) -> Tuple[Optional[int], List[Tuple[int, str]]]:
+    """
+    Resolve `name_field` and `phone_fields` to column indices in `headers`, once per run.
+    Returns (name_idx, [(phone_idx, label), ...]); name_idx is None and unknown phone
+    fields are dropped when missing. Like DictReader, a duplicated header maps to its last column.
+    """
+    columns = {h: j for j, h in enumerate(headers)}
+    phone_labels = phone_labels or []
+    phone_cols = [(columns[pf], _phone_label(phone_labels, idx))
+                  for idx, pf in enumerate(phone_fields) if pf in columns]
+    return columns.get(name_field), phone_cols
+
 
+def _cells_getter(cols: List[int]) -> Callable[[List[str]], Tuple[str, ...]]:
+    # like itemgetter(*cols), but always returns a tuple
+    if not cols:
+        return lambda row: ()
+    if len(cols) == 1:
+        j = cols[0]
+        return lambda row: (row[j],)
+    return itemgetter(*cols)
 
-def write_vcards_stream(path: str, out_path: str, name_field: str, phone_fields: List[str], phone_labels: Optional[List[str]] = None, prefix: str = "", postfix: str = "", progress: Optional[Callable[[int, int], None]] = None, stop_event: Optional[threading.Event] = None) -> int:
+
+def write_vcards_stream(path: str, out_path: str, name_field: str, phone_fields: List[str], phone_labels: Optional[List[str]] = None, prefix: str = "", postfix: str = "", progress: Optional[Callable[[int, int], None]] = None, stop_event: Optional["threading.Event"] = None) -> int:
     """
     Stream contacts from CSV at `path` and write vCards to `out_path`.
     `phone_fields` is a list of CSV column names to pull phone numbers from.
     `phone_labels` is an optional list of labels matching `phone_fields` (defaults to CELL).
-    `progress` is an optional callback(progressed, total).
+    `progress` is an optional callback(bytes_read, file_size), called at most every
+    50 ms between row batches and once more when done.
+    `stop_event` is checked once per row batch (`Event.is_set` only reads a flag).
     Returns number of vCards written.
     """
-    total = count_csv_rows(path)
+    total = os.path.getsize(path)
     written = 0
-    phone_labels = phone_labels or ["CELL"] * len(phone_fields)
-    with open(path, newline="", encoding="utf-8") as f_in, open(out_path, "w", encoding="utf-8", newline="") as vcf:
-        reader = csv.DictReader(f_in)
-        for i, row in enumerate(reader, start=1):
-            if stop_event and stop_event.is_set():
+    # vCards are collected in `buf` and written in ~64 KiB chunks
+    buf: List[str] = []
+    buflen = 0
+    fmt = format_row
+    prefix = prefix.strip()
+    postfix = postfix.strip()
+    is_stopped = stop_event.is_set if stop_event is not None else None
+    with open(path, newline="", encoding="utf-8-sig") as f_in, open(out_path, "wb", buffering=_WRITE_BUFFER_SIZE) as vcf:
+        reader = csv.reader(f_in)
+        headers = next(reader, [])
+        name_idx, phone_cols = _resolve_columns(headers, name_field, phone_fields, phone_labels)
+        labels = [label for _, label in phone_cols]
+        # all needed cells are pulled out of a row with one itemgetter call; the name goes last
+        cols = [j for j, _ in phone_cols] + ([name_idx] if name_idx is not None else [])
+        get_cells = _cells_getter(cols)
+        # blank lines are skipped, as DictReader does
+        rows = filter(None, reader)
+        # byte offset of the underlying binary file (text-mode tell() is disabled while iterating)
+        tell = f_in.buffer.tell
+        pos = total
+        next_tick = 0.0
+        while True:
+            batch = list(islice(rows, _ROW_BATCH_SIZE))
+            if not batch:
+                break
+            if is_stopped is not None and is_stopped():
                 # Interrupted by GUI cancel
+                pos = tell()
                 break
-            name = (row.get(name_field) or "").strip()
-            phones = []
-            for idx, pf in enumerate(phone_fields):
-                num = (row.get(pf) or "").strip()
-                label = phone_labels[idx] if idx < len(phone_labels) else "CELL"
-                if num:
-                    phones.append({"number": num, "label": label})
-            if not phones:
-                # skip rows without phones
+            for row in batch:
+                try:
+                    cells = get_cells(row)
+                except IndexError:
+                    # short row: missing trailing cells are empty
+                    cells = tuple(row[j] if j < len(row) else "" for j in cols)
+                name = cells[-1] if name_idx is not None else ""
+                phones = [(num, label) for num, label in zip(cells, labels) if num.strip()]
+                if not phones:
+                    # skip rows without phones
+                    continue
+                card = fmt(name, phones, prefix, postfix)
+                buf.append(card)
+                buflen += len(card)
+                if buflen >= _FLUSH_THRESHOLD:
+                    vcf.write("".join(buf).encode("utf-8"))
+                    buf.clear()
+                    buflen = 0
+                written += 1
+            if progress and time.monotonic() >= next_tick:
+                # the offset includes read-ahead, so it can briefly run past the rows written
+                progress(min(tell(), total), total)
+                next_tick = time.monotonic() + _PROGRESS_INTERVAL
+        if buf:
+            vcf.write("".join(buf).encode("utf-8"))
+    if progress:
+        progress(min(pos, total), total)
+    return written
+
+
+_ARROW_BLOCK_SIZE = 1 << 20
+
+
+def write_vcards_vectorized(path: str, out_path: str, name_field: str, phone_fields: List[str], phone_labels: Optional[List[str]] = None, prefix: str = "", postfix: str = "", progress: Optional[Callable[[int, int], None]] = None, stop_event: Optional["threading.Event"] = None) -> int:
+    """
+    Same output as `write_vcards_stream`, but the CSV is parsed by pyarrow in
+    batches and phone columns are trimmed/sanitized with pyarrow compute kernels.
+    `progress(bytes_read, file_size)` and `stop_event` are checked once per batch.
+    Falls back to `write_vcards_stream` when pyarrow is not installed or cannot
+    handle the file (duplicate headers, ragged rows, ...).
+    Returns number of vCards written.
+    """
+    def fallback() -> int:
+        return write_vcards_stream(path, out_path, name_field, phone_fields, phone_labels, prefix, postfix, progress, stop_event)
+
+    headers = get_csv_fieldnames(path) or []
+    name_idx, phone_idx_cols = _resolve_columns(headers, name_field, phone_fields, phone_labels)
+    if not _load_pyarrow() or not phone_idx_cols or len(set(headers)) != len(headers):
+        return fallback()
+
+    # headers are unique here, so columns can be addressed by name
+    phone_cols = [(headers[j], label) for j, label in phone_idx_cols]
+    # include_columns fixes the order of the columns in every batch
+    used = list(dict.fromkeys(([headers[name_idx]] if name_idx is not None else []) + [pf for pf, _ in phone_cols]))
+    name_pos = 0 if name_idx is not None else None
+    total = os.path.getsize(path)
+    prefix = prefix.strip()
+    postfix = postfix.strip()
+    written = 0
+    try:
+        # reading through our own handle lets progress report its byte offset
+        with open(path, "rb") as f_in, open(out_path, "wb", buffering=_WRITE_BUFFER_SIZE) as vcf:
+            reader = pacsv.open_csv(
+                f_in,
+                read_options=pacsv.ReadOptions(block_size=_ARROW_BLOCK_SIZE),
+                parse_options=pacsv.ParseOptions(newlines_in_values=True),
+                convert_options=pacsv.ConvertOptions(column_types={c: pa.string() for c in used}, include_columns=used),
+            )
+            is_stopped = stop_event.is_set if stop_event is not None else None
+            for batch in reader:
+                if is_stopped is not None and is_stopped():
+                    # Interrupted by GUI cancel
+                    break
+                n = batch.num_rows
+                names = batch.column(name_pos).to_pylist() if name_pos is not None else [""] * n
+                phone_data = []
+                for pf, label in phone_cols:
+                    raw = batch.column(used.index(pf))
+                    present = pc.not_equal(pc.utf8_length(pc.utf8_trim_whitespace(raw)), 0).to_pylist()
+                    nums = pc.replace_substring_regex(raw, pattern=PHONE_STRIP_PATTERN, replacement="").to_pylist()
+                    phone_data.append((present, nums, label))
+                buf = []
+                for r in range(n):
+                    phones = [(nums[r], label) for present, nums, label in phone_data if present[r]]
+                    if not phones:
+                        # skip rows without phones
+                        continue
+                    buf.append(format_row(names[r], phones, prefix, postfix))
+                vcf.write("".join(buf).encode("utf-8"))
+                written += len(buf)
                 if progress:
-                    progress(i, total)
-                continue
-            parts = []
-            if prefix:
-                parts.append(prefix.strip())
-            if name:
-                parts.append(name)
-            if postfix:
-                parts.append(postfix.strip())
-            full_name = " ".join(parts).strip()
-            vcf.write(format_vcard(full_name, phones))
-            written += 1
-            if progress:
-                progress(i, total)
+                    progress(min(f_in.tell(), total), total)
+    except pa.ArrowInvalid:
+        return fallback()
     return written
 
 
@@ -241,7 +316,7 @@ def main():
     if args.phone_labels:
         phone_labels = [s.strip() for s in args.phone_labels.split(',') if s.strip()]
 
-    written = write_vcards_stream(input_path, output_path, name_field, valid_phone_fields, phone_labels, args.prefix, args.postfix, progress=None)
+    written = write_vcards_vectorized(input_path, output_path, name_field, valid_phone_fields, phone_labels, args.prefix, args.postfix)
     print(f"Wrote {written} vCards to {output_path}")
 
 
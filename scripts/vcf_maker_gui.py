@@ -1,3 +1,7 @@
+import codecs
+import io
+import json
+import mmap
 import os
 import sys
 import threading
@@ -5,6 +9,8 @@ import subprocess
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, ttk
 import csv
+from collections import deque
+from itertools import islice
 
 try:
     # optional: tkinterdnd2 provides easier drag-and-drop if installed
@@ -14,58 +20,136 @@ except Exception:
     TkinterDnD = None
     DND_AVAILABLE = False
 
+try:
+    # optional: charset_normalizer guesses the encoding of CSVs that are not UTF-8
+    from charset_normalizer import from_bytes as detect_charset
+except Exception:
+    detect_charset = None
+
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 VCF_SCRIPT = os.path.join(SCRIPT_DIR, "vcf_maker.py")
 
+# import the vcf_maker module from the scripts dir once, at startup
+if SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, SCRIPT_DIR)
+try:
+    import vcf_maker
+    vcf_maker_import_error = None
+except ImportError as e:
+    # not fatal: the GUI still starts and load_vcf_maker() retries when a run starts
+    vcf_maker = None
+    vcf_maker_import_error = e
+
+
+def load_vcf_maker():
+    # retry the import at use time if it failed when the GUI module loaded
+    global vcf_maker
+    if vcf_maker is None:
+        import vcf_maker as module
+        vcf_maker = module
+    return vcf_maker
+
+
+# most lines kept in the log widget (and queued between flushes)
+LOG_MAX_LINES = 1000
+
+
+def make_log_writer(root, log_widget, max_lines=LOG_MAX_LINES):
+    # return append(text): text is queued (from any thread) and written to log_widget
+    # on the Tk main thread every 100 ms, trimming the widget to its last `max_lines` lines
+    log_queue = deque(maxlen=max_lines)
+    state = {"scheduled": False}
+
+    def flush():
+        state["scheduled"] = False
+        parts = []
+        while log_queue:
+            parts.append(log_queue.popleft())
+        log_widget.configure(state=tk.NORMAL)
+        log_widget.insert(tk.END, "".join(parts))
+        lines = int(log_widget.index("end-1c").split(".")[0])
+        if lines > max_lines:
+            log_widget.delete("1.0", f"{lines - max_lines + 1}.0")
+        log_widget.see(tk.END)
+        log_widget.configure(state=tk.DISABLED)
+
+    def append(text):
+        log_queue.append(text)
+        if not state["scheduled"]:
+            state["scheduled"] = True
+            root.after(100, flush)
+
+    return append
+
+
+def open_folder(path):
+    # open `path` in the system file manager without making the Tk loop wait on it
+    if os.name == 'nt':
+        # os.startfile passes the path to the shell untouched; explorer's command line would split it at commas
+        def start():
+            try:
+                os.startfile(path)
+            except Exception:
+                pass
+        threading.Thread(target=start, daemon=True).start()
+        return
+    if sys.platform == 'darwin':
+        cmd = ['open', path]
+    else:
+        cmd = ['xdg-open', path]
+    subprocess.Popen(cmd, close_fds=True)
 
-def run_vcf_maker(input_path, output_path, name_field, phone_fields, phone_labels, prefix, postfix, log_widget, run_button, root, progressbar, stop_event=None):
+
+def run_vcf_maker(input_path, output_path, name_field, phone_fields, phone_labels, prefix, postfix, log_widget, run_button, root, progressbar, stop_event=None, status_var=None):
     def target():
         run_button.config(state=tk.DISABLED)
         progressbar['value'] = 0
         progressbar['maximum'] = 100
         log_widget.configure(state=tk.NORMAL)
         log_widget.delete("1.0", tk.END)
+        log_widget.configure(state=tk.DISABLED)
+        log = make_log_writer(root, log_widget)
         try:
-            # import the vcf_maker module from the scripts dir
-            if SCRIPT_DIR not in sys.path:
-                sys.path.insert(0, SCRIPT_DIR)
-            import vcf_maker
+            # latest progress from the worker; at most one UI update is pending at a time
+            pending = {"processed": 0, "total": 0, "scheduled": False}
+
+            def flush_progress():
+                # clear the flag before reading so a report arriving meanwhile schedules another flush
+                pending["scheduled"] = False
+                processed, total = pending["processed"], pending["total"]
+                try:
+                    pct = int(processed / total * 100) if total else 0
+                except Exception:
+                    pct = 0
+                progressbar['value'] = pct
+                # progress goes to the status label only; logging every tick bloats the log widget
+                if status_var is not None:
+                    status_var.set(f"Processed {pct}%")
 
             def progress_cb(processed, total):
-                # schedule UI updates on main thread
-                def ui_update():
-                    try:
-                        pct = int(processed / total * 100) if total else 0
-                    except Exception:
-                        pct = 0
-                    progressbar['value'] = pct
-                    log_widget.insert(tk.END, f"Processed {processed}/{total}\n")
-                    try:
-                        # update status label with row counts
-                        status_var.set(f"Rows: {total} — processed {processed}")
-                    except Exception:
-                        pass
-                    log_widget.see(tk.END)
-                root.after(1, ui_update)
-
-            written = vcf_maker.write_vcards_stream(input_path, output_path, name_field, phone_fields, phone_labels, prefix, postfix, progress_cb, stop_event)
+                pending["processed"] = processed
+                pending["total"] = total
+                if not pending["scheduled"]:
+                    pending["scheduled"] = True
+                    # schedule UI updates on main thread
+                    root.after(50, flush_progress)
+
+            written = load_vcf_maker().write_vcards_stream(input_path, output_path, name_field, phone_fields, phone_labels, prefix, postfix, progress_cb, stop_event)
 
             def on_done():
-                log_widget.insert(tk.END, f"\nFinished. {written} vCards written to {output_path}\n")
-                log_widget.see(tk.END)
+                log(f"\nFinished. {written} vCards written to {output_path}\n")
                 try:
                     out_dir = os.path.dirname(os.path.abspath(output_path)) or os.getcwd()
                     if os.path.isdir(out_dir):
-                        os.startfile(out_dir)
+                        open_folder(out_dir)
                 except Exception:
                     pass
                 messagebox.showinfo("Done", f"VCF created: {os.path.basename(output_path)}")
             root.after(50, on_done)
         except Exception as e:
-            log_widget.insert(tk.END, f"Error: {e}\n")
+            log(f"Error: {e}\n")
         finally:
-            log_widget.configure(state=tk.DISABLED)
             run_button.config(state=tk.NORMAL)
 
     threading.Thread(target=target, daemon=True).start()
@@ -90,28 +174,109 @@ def browse_output(entry_widget):
         entry_widget.insert(0, p)
 
 
-def load_csv_preview(path: str):
-    # return headers and up to first 5 rows as list of dicts
-    rows = []
-    # try common encodings
-    encodings = ["utf-8", "utf-8-sig", "latin-1"]
-    headers = []
-    for enc in encodings:
+# (path, mtime_ns, size) -> (headers, rows), so re-validating an unchanged file does not re-read it
+_preview_cache = {}
+_PREVIEW_CACHE_SIZE = 8
+# several preview worker threads may read and evict at the same time
+_preview_cache_lock = threading.Lock()
+
+
+# columns shown in the preview table; the rest are summarised by one "…" column
+PREVIEW_MAX_COLUMNS = 20
+PREVIEW_MORE_COLUMN = "__more__"
+
+
+# bytes read from the start of the file to detect its encoding and build the preview
+PREVIEW_SAMPLE_SIZE = 32768
+
+
+def detect_encoding(sample: bytes) -> str:
+    # BOMs first (UTF-32 before UTF-16: the UTF-32-LE BOM starts with the UTF-16-LE one)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE)):
+        return "utf-32"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        # incremental decoding tolerates a character cut in half at the end of the sample
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    if detect_charset is not None:
+        best = detect_charset(sample).best()
+        if best is not None:
+            return best.encoding
+    return "latin-1"
+
+
+def _read_preview_rows(text: str, strict: bool):
+    reader = csv.reader(io.StringIO(text, newline=""), strict=strict)
+    headers = next(reader, [])
+    # blank lines are skipped and short rows padded with None, as DictReader does
+    rows = [dict(zip(headers, r + [None] * (len(headers) - len(r)))) for r in islice(filter(None, reader), 5)]
+    return headers, rows
+
+
+def _parse_preview(text: str, check_quoting: bool = True):
+    # return (headers, rows, warning). Rows are parsed leniently, the way write_vcards_stream reads them;
+    # a strict pass only decides whether to warn about malformed quoting
+    if check_quoting:
         try:
-            with open(path, newline="", encoding=enc) as f:
-                reader = csv.DictReader(f)
-                headers = reader.fieldnames or []
-                for i, r in enumerate(reader):
-                    if i >= 5:
-                        break
-                    rows.append(r)
-            if headers:
+            return _read_preview_rows(text, True) + (None,)
+        except csv.Error as e:
+            return _read_preview_rows(text, False) + (f"malformed CSV quoting ({e})",)
+    return _read_preview_rows(text, False) + (None,)
+
+
+def load_csv_preview(path: str):
+    # return headers, up to first 5 rows as list of dicts, and a parse warning or None
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _preview_cache_lock:
+        cached = _preview_cache.get(key)
+    if cached is not None:
+        return cached
+    if not st.st_size:
+        # mmap refuses empty files
+        return [], [], None
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # the encoding is detected on the whole window: a non-UTF-8 byte may only show up past the first lines
+        sample = mm[:PREVIEW_SAMPLE_SIZE]
+        encoding = detect_encoding(sample)
+        # charset_normalizer reports codec aliases such as utf_16_le; compare canonical names
+        wide = codecs.lookup(encoding).name.startswith(("utf-16", "utf-32"))
+        # header + 5 rows: only decode up to the 6th newline
+        end = -1
+        for _ in range(6):
+            end = mm.find(b"\n", end + 1, PREVIEW_SAMPLE_SIZE)
+            if end == -1:
                 break
-        except Exception:
-            rows = []
-            headers = []
-            continue
-    return headers, rows
+        head = sample[:end + 1] if end != -1 else None
+        result = None
+        # a b"\n" byte is not a line end in UTF-16/32, nor inside an open quoted field
+        if head is not None and not wide and not head.count(b'"') % 2:
+            result = _parse_preview(head.decode(encoding, errors="replace"))
+        # with malformed quoting the quote count cannot tell where fields end, so the slice is only trusted
+        # when it parses strictly
+        if result is None or result[2] or len(result[1]) < 5 and end + 1 < min(len(mm), PREVIEW_SAMPLE_SIZE):
+            # quoted newlines, blank lines or bad quoting: fall back to the whole sample window
+            text = sample.decode(encoding, errors="replace")
+            truncated = len(sample) == PREVIEW_SAMPLE_SIZE
+            if truncated:
+                # drop the partial last line
+                cut = text.rfind("\n")
+                if cut != -1:
+                    text = text[:cut + 1]
+            # a cut window may end inside a long quoted field, which is not worth a warning
+            result = _parse_preview(text, check_quoting=not truncated)
+    with _preview_cache_lock:
+        if len(_preview_cache) >= _PREVIEW_CACHE_SIZE:
+            # evict the oldest entry
+            _preview_cache.pop(next(iter(_preview_cache)), None)
+        _preview_cache[key] = result
+    return result
 
 
 def build_gui():
@@ -134,7 +299,16 @@ def build_gui():
     # Keep track of last auto-generated output so we don't overwrite a user choice
     last_auto = {"value": ""}
 
+    # pending root.after id for the debounced KeyRelease refresh, and the number of the
+    # latest preview request (results of older requests still loading are dropped)
+    preview_job = {"id": None, "seq": 0, "warning": False}
+
     def update_output_default(event=None):
+        if preview_job["id"] is not None:
+            root.after_cancel(preview_job["id"])
+            preview_job["id"] = None
+        preview_job["seq"] += 1
+        seq = preview_job["seq"]
         input_path = input_entry.get().strip()
         if not input_path:
             try:
@@ -151,21 +325,58 @@ def build_gui():
             output_entry.insert(0, suggested)
             last_auto["value"] = suggested
         # load preview and populate field selectors
-        try:
-            headers, rows = load_csv_preview(input_path)
-            populate_field_selectors(headers)
-            populate_preview(rows)
+        if not os.path.isfile(input_path):
+            populate_field_selectors([])
+            populate_preview([])
             try:
-                run_button.config(state=tk.NORMAL)
+                run_button.config(state=tk.DISABLED)
             except Exception:
                 pass
-        except Exception:
+            return
+
+        def apply_preview(headers, rows, warning):
+            if seq != preview_job["seq"]:
+                return
+            try:
+                populate_field_selectors(headers)
+                populate_preview(rows)
+                run_button.config(state=tk.NORMAL)
+                if warning:
+                    # the converter reads the file just as leniently, so this only informs and Run stays enabled
+                    status_var.set(f"Warning: {warning}")
+                    preview_job["warning"] = True
+                elif preview_job["warning"]:
+                    preview_job["warning"] = False
+                    status_var.set("Processed 0%")
+            except Exception:
+                preview_failed()
+
+        def preview_failed():
+            if seq != preview_job["seq"]:
+                return
             try:
                 run_button.config(state=tk.DISABLED)
             except Exception:
                 pass
 
-    input_entry.bind("<KeyRelease>", update_output_default)
+        def preview_worker():
+            # read the file off the Tk thread; widgets are only touched back on it via root.after
+            try:
+                headers, rows, warning = load_csv_preview(input_path)
+            except Exception:
+                root.after(0, preview_failed)
+                return
+            root.after(0, lambda: apply_preview(headers, rows, warning))
+
+        threading.Thread(target=preview_worker, daemon=True).start()
+
+    def schedule_update(event=None):
+        # debounce typing: refresh only once the path has been stable for 250 ms
+        if preview_job["id"] is not None:
+            root.after_cancel(preview_job["id"])
+        preview_job["id"] = root.after(250, update_output_default)
+
+    input_entry.bind("<KeyRelease>", schedule_update)
     input_entry.bind("<FocusOut>", update_output_default)
 
     tk.Button(frame, text="Browse...", command=lambda: browse_input(input_entry, update_output_default)).grid(row=0, column=2)
@@ -214,14 +425,17 @@ def build_gui():
             return
         name_field_combo['values'] = headers
         phone_fields_listbox.delete(0, tk.END)
+        phone_fields_listbox.insert(tk.END, *headers)
+        # heuristics to pick defaults; lower-cased once, first matching header wins as before
+        lower_map = {}
         for h in headers:
-            phone_fields_listbox.insert(tk.END, h)
-        # heuristics to pick defaults
+            lower_map.setdefault(h.lower(), h)
+
         def pick(pref_list):
             for p in pref_list:
-                for h in headers:
-                    if h.lower() == p:
-                        return h
+                h = lower_map.get(p)
+                if h is not None:
+                    return h
             return headers[0]
         name_default = pick(['name', 'full_name', 'fullname', 'fn'])
         phone_default = pick(['phone', 'phone_number', 'mobile', 'cell'])
@@ -273,7 +487,6 @@ def build_gui():
         p = filedialog.asksaveasfilename(title='Save mapping', defaultextension='.json', filetypes=[('JSON', '*.json')])
         if p:
             try:
-                import json
                 with open(p, 'w', encoding='utf-8') as f:
                     json.dump(mapping, f, ensure_ascii=False, indent=2)
                 messagebox.showinfo('Saved', f'Mapping saved to {p}')
@@ -285,7 +498,6 @@ def build_gui():
         if not p:
             return
         try:
-            import json
             with open(p, 'r', encoding='utf-8') as f:
                 mapping = json.load(f)
             if 'name_field' in mapping:
@@ -293,12 +505,14 @@ def build_gui():
             if 'phone_fields' in mapping and isinstance(mapping['phone_fields'], list):
                 # select items in listbox
                 phone_fields_listbox.selection_clear(0, tk.END)
+                # fetch the listbox items once; first occurrence wins, like list.index
+                index_map = {}
+                for i, item in enumerate(phone_fields_listbox.get(0, tk.END)):
+                    index_map.setdefault(item, i)
                 for val in mapping['phone_fields']:
-                    try:
-                        idx = phone_fields_listbox.get(0, tk.END).index(val)
+                    idx = index_map.get(val)
+                    if idx is not None:
                         phone_fields_listbox.selection_set(idx)
-                    except ValueError:
-                        pass
             if 'phone_labels' in mapping:
                 phone_labels_entry.delete(0, tk.END)
                 phone_labels_entry.insert(0, mapping['phone_labels'])
@@ -319,28 +533,35 @@ def build_gui():
     tk.Button(frame, text='Load mapping', command=load_mapping).grid(row=9, column=2, sticky=tk.W, pady=(6,0))
 
     def populate_preview(rows):
-        # clear
-        for c in preview.get_children():
-            preview.delete(c)
+        # clear (one Tk call for all items)
+        preview.delete(*preview.get_children())
         if not rows:
             return
         headers = list(rows[0].keys())
-        preview['columns'] = headers
-        # compute column widths based on content (chars)
-        col_widths = {h: max(len(h), 10) for h in headers}
-        for r in rows:
-            for h in headers:
-                val = str(r.get(h, '') or '')
-                col_widths[h] = max(col_widths[h], len(val))
-        for h in headers:
+        # the preview is only for orientation; very wide files get a trailing "…" column
+        more = len(headers) > PREVIEW_MAX_COLUMNS
+        if more:
+            headers = headers[:PREVIEW_MAX_COLUMNS]
+        # stringify each cell once; the strings feed both the width estimate and the inserts
+        str_rows = [[str(r.get(h, '') or '') for h in headers] for r in rows]
+        if more:
+            preview['columns'] = headers + [PREVIEW_MORE_COLUMN]
+            preview.heading(PREVIEW_MORE_COLUMN, text="…")
+            preview.column(PREVIEW_MORE_COLUMN, width=30, stretch=False, anchor='w')
+            for sr in str_rows:
+                sr.append("…")
+        else:
+            preview['columns'] = headers
+        for i, h in enumerate(headers):
             preview.heading(h, text=h)
-            # set width in pixels approx (char*7)
-            preview.column(h, width=min(col_widths[h] * 7, 400), anchor='w')
-        for r in rows:
-            preview.insert('', tk.END, values=[r.get(h, '') for h in headers])
-
-    # status label for counts
-    status_var = tk.StringVar(value="Rows: 0")
+            # compute column width based on content (chars), set in pixels approx (char*7)
+            width = max(len(h), 10, *(len(sr[i]) for sr in str_rows))
+            preview.column(h, width=min(width * 7, 400), anchor='w')
+        for sr in str_rows:
+            preview.insert('', tk.END, values=sr)
+
+    # status label for run progress
+    status_var = tk.StringVar(value="Processed 0%")
     status_lbl = tk.Label(frame, textvariable=status_var)
     status_lbl.grid(row=5, column=2, sticky=tk.E)
 
@@ -371,7 +592,7 @@ def build_gui():
         stop_event = threading.Event()
         cancel_button.config(state=tk.NORMAL)
 
-        run_vcf_maker(input_path, output_path, name_field, phone_fields, phone_labels, prefix, postfix, log, run_button, root, progress, stop_event)
+        run_vcf_maker(input_path, output_path, name_field, phone_fields, phone_labels, prefix, postfix, log, run_button, root, progress, stop_event, status_var)
 
     run_button = tk.Button(frame, text="Run", width=12, command=on_run)
     run_button.grid(row=7, column=1, pady=10, sticky=tk.W)
@@ -401,36 +622,51 @@ def build_gui():
 
             WNDPROC = ctypes.WINFUNCTYPE(wintypes.LRESULT, wintypes.HWND, wintypes.UINT, wintypes.WPARAM, wintypes.LPARAM)
 
+            # HDROP handles are pointer-sized; declare the signatures so they are not truncated to int
+            shell32.DragQueryFileW.argtypes = [wintypes.HANDLE, wintypes.UINT, wintypes.LPWSTR, wintypes.UINT]
+            shell32.DragQueryFileW.restype = wintypes.UINT
+            shell32.DragFinish.argtypes = [wintypes.HANDLE]
+            shell32.DragAcceptFiles.argtypes = [wintypes.HWND, wintypes.BOOL]
+
             hwnd = root.winfo_id()
+            # without this Windows may not deliver WM_DROPFILES to the window at all
+            shell32.DragAcceptFiles(hwnd, True)
 
             old_wndproc = WNDPROC(user32.GetWindowLongPtrW(hwnd, GWL_WNDPROC))
+            # one buffer for every drop, large enough for long (\\?\) paths
+            DROP_BUF_LEN = 32768
+            drop_buf = ctypes.create_unicode_buffer(DROP_BUF_LEN)
 
-            def py_wndproc(hWnd, msg, wParam, lParam):
+            # every window message passes through here, so the callables are bound as defaults
+            def py_wndproc(hWnd, msg, wParam, lParam, call_next=user32.CallWindowProcW, next_proc=old_wndproc,
+                           query=shell32.DragQueryFileW, finish=shell32.DragFinish):
                 if msg == WM_DROPFILES:
-                    count = shell32.DragQueryFileW(wParam, 0xFFFFFFFF, None, 0)
-                    if count > 0:
-                        buf_len = shell32.DragQueryFileW(wParam, 0, None, 0)
-                        buf = ctypes.create_unicode_buffer(buf_len + 1)
-                        shell32.DragQueryFileW(wParam, 0, buf, buf_len + 1)
-                        path = buf.value
+                    # returns the number of characters copied; 0 when there is no file
+                    n = query(wParam, 0, drop_buf, DROP_BUF_LEN)
+                    if n > 0:
+                        path = drop_buf.value[:n]
                         try:
                             root.after(10, lambda: (input_entry.delete(0, tk.END), input_entry.insert(0, path), update_output_default()))
                         except Exception:
                             pass
-                    shell32.DragFinish(wParam)
+                    finish(wParam)
                     return 0
-                return user32.CallWindowProcW(old_wndproc, hWnd, msg, wParam, lParam)
+                return call_next(next_proc, hWnd, msg, wParam, lParam)
 
             new_wndproc = WNDPROC(py_wndproc)
             user32.SetWindowLongPtrW(hwnd, GWL_WNDPROC, new_wndproc)
         except Exception:
             pass
 
+    if vcf_maker is None:
+        if os.path.exists(VCF_SCRIPT):
+            reason = f"Could not import vcf_maker: {vcf_maker_import_error}"
+        else:
+            reason = f"Could not find vcf_maker.py at {VCF_SCRIPT}"
+        root.after(0, lambda: messagebox.showwarning("vcf_maker unavailable", f"{reason}\n\nThe import is retried when you press Run.", parent=root))
+
     root.mainloop()
 
 
 if __name__ == "__main__":
-    if not os.path.exists(VCF_SCRIPT):
-        tk.messagebox.showerror("Missing script", f"Could not find vcf_maker.py at {VCF_SCRIPT}")
-        sys.exit(1)
     build_gui()
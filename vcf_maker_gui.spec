@@ -5,12 +5,12 @@ a = Analysis(
     ['scripts\\vcf_maker_gui.py'],
     pathex=[],
     binaries=[],
-    datas=[('scripts\\vcf_maker.py', '.')],
+    datas=[('scripts\\vcf_maker.py', '.'), ('scripts\\_vcf_fast.py', '.')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['pyarrow'],
     noarchive=False,
     optimize=0,
 )